@@ -6,15 +6,22 @@ import asyncio
 import nest_asyncio
 import base64
 import mimetypes
-from typing import Type, TypeVar, Optional
+import json
+from collections import OrderedDict
+from functools import lru_cache
+from hashlib import blake2b
+from itertools import batched
+from operator import attrgetter
+from typing import Any, Callable, Type, TypeVar, Optional, Sequence
 from litellm import acompletion, Choices
 from litellm.files.main import RateLimitError, ModelResponse
+from litellm.exceptions import Timeout, APIConnectionError, InternalServerError, ServiceUnavailableError
 from pydantic import BaseModel
-from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
-from sqlmodel import Session, select
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
+from sqlmodel import Session, SQLModel, select, col
 
 from llm_classifier.database import ClassificationInput, ClassificationResponse
-from llm_classifier.validators import get_placeholders
+from llm_classifier.validators import get_placeholders, get_template_prefix
 from llm_classifier.parser import get_model_from_json, get_gemini_schema
 
 
@@ -22,68 +29,248 @@ from llm_classifier.parser import get_model_from_json, get_gemini_schema
 
 dotenv.load_dotenv(override=True)
 T = TypeVar('T', bound=BaseModel)
+LLM_MODEL = "openrouter/google/gemini-2.5-flash-preview"
+# Maximum number of parsed responses kept in the in-process response cache;
+# 0 disables the cache
+RESPONSE_CACHE_SIZE = int(os.getenv("LLM_CLASSIFIER_RESPONSE_CACHE_SIZE", 1024))
+# Maximum number of ids bound into a single IN clause
+IN_CLAUSE_BATCH_SIZE = 1000
+# Media is base64-encoded in chunks of this many bytes (a multiple of 3, so the
+# encoded chunks concatenate without padding)
+MEDIA_ENCODE_CHUNK_SIZE = 3 * 2**16
+
+# The template prefix depends only on the template, which is constant across a
+# batch
+cached_template_prefix = lru_cache(maxsize=64)(get_template_prefix)
+
+
+# Field values of parsed responses keyed by a hash of the request, least
+# recently used first. Plain data is stored rather than model instances, since
+# copies of a table model share its ORM state
+_response_cache: OrderedDict[bytes, dict[str, Any]] = OrderedDict()
+# Held while a request is in flight, so identical concurrent requests wait for
+# its cached response rather than calling the LLM again
+_response_locks: dict[bytes, asyncio.Lock] = {}
+# Number of requests holding or waiting on each lock, so a lock is discarded
+# only once nothing is queued on it
+_response_lock_users: dict[bytes, int] = {}
 
 
 # --- Functions ---
 
-# Allow asyncio to run in nested loops
-nest_asyncio.apply()
+# Allow asyncio to run in nested loops (e.g., in notebooks) only on request,
+# since patching the event loop adds overhead to every await
+if os.getenv("LLM_CLASSIFIER_NESTED_LOOP"):
+    nest_asyncio.apply()
+
+
+CONCURRENCY_LIMIT = int(os.getenv("CONCURRENCY_LIMIT", 1))
 
 
 def get_concurrency_limit() -> int:
-    """Returns the CONCURRENCY_LIMIT environment variable, or 1 if not set."""
-    return int(os.getenv("CONCURRENCY_LIMIT", 1))
+    """Returns the CONCURRENCY_LIMIT environment variable as read at import, or
+    1 if not set."""
+    return CONCURRENCY_LIMIT
+
+
+# Shared by every classification call on the running event loop, so that the
+# concurrency limit applies across all concurrent callers
+_semaphore: Optional[asyncio.Semaphore] = None
+_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_semaphore() -> asyncio.Semaphore:
+    """Returns the semaphore limiting concurrent LLM requests, creating it on
+    first use for the running event loop."""
+    global _semaphore, _semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _semaphore is None or _semaphore_loop is not loop:
+        _semaphore = asyncio.Semaphore(get_concurrency_limit())
+        _semaphore_loop = loop
+    return _semaphore
+
+
+# Transient provider errors worth retrying
+RETRYABLE_ERRORS = (
+    RateLimitError,
+    Timeout,
+    APIConnectionError,
+    InternalServerError,
+    ServiceUnavailableError,
+)
 
 
 def should_retry_error(exception: BaseException) -> bool:
-    if isinstance(exception, RateLimitError):
-        return True
-    return False
+    return isinstance(exception, RETRYABLE_ERRORS)
 
 
 @retry(
     retry=retry_if_exception(should_retry_error),
     stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=4, max=10)
+    # Jitter spreads out retries from concurrent requests hitting the same limit
+    wait=wait_random_exponential(multiplier=1, max=30),
+    reraise=True
 )
-async def classify_input(prompt: str, model_class: Type[T], media_data: Optional[list[str]] = None) -> T | None:
-    """Classify a single text using the LLM with retry logic. Optionally includes media."""
+async def request_completion(messages: list[dict[str, object]], model_class: Type[T]) -> str:
+    """Send messages to the LLM with retry logic and return the response text."""
+    # Only hold a concurrency slot for the duration of the request itself
+    async with get_semaphore():
+        response = await acompletion(
+            model=LLM_MODEL,
+            messages=messages,
+            response_format={"type": "json_object", "response_schema": get_gemini_schema(model_class)}
+        )
+    assert isinstance(response, ModelResponse) and isinstance(response.choices[0], Choices), f"Response is not a ModelResponse: {type(response)}"
+    message_content = response.choices[0].message.content
+    assert isinstance(message_content, str), f"Message content is not a string: {type(message_content)}"
+    return message_content
+
+
+def build_messages(prompt: str, media_data: Optional[list[str]] = None, prompt_prefix: Optional[str] = None) -> list[dict[str, object]]:
+    """Build the chat messages for a prompt and optional media. If the prompt
+    starts with `prompt_prefix` (the static part of the prompt template), the
+    prefix is marked as cacheable by the provider."""
+    content: list[dict[str, object]]
+    if prompt_prefix and prompt.startswith(prompt_prefix):
+        # Send the shared prefix as a separate cache breakpoint so only the
+        # per-input remainder is processed from scratch on each request
+        content = [{"type": "text", "text": prompt_prefix, "cache_control": {"type": "ephemeral"}}]
+        if len(prompt) > len(prompt_prefix):
+            content.append({"type": "text", "text": prompt[len(prompt_prefix):]})
+    else:
+        content = [{"type": "text", "text": prompt}]
+
+    # Add each media item as an image_url entry
+    for media_item in media_data or []:
+        content.append({
+            "type": "image_url",
+            "image_url": {"url": media_item}
+        })
+
+    return [{"role": "user", "content": content}]
+
+
+def get_media_digest(media_data: list[str]) -> bytes:
+    """Hash encoded media for use in a cache key."""
+    digest = blake2b(digest_size=32)
+    for media_item in media_data:
+        # Prefix each item with its length, so item boundaries are part of
+        # the hash
+        digest.update(len(media_item).to_bytes(8))
+        digest.update(media_item.encode('ascii'))
+    return digest.digest()
+
+
+def get_cache_key(prompt: str, media_digest: Optional[bytes], model_class: Type[BaseModel]) -> bytes:
+    """Hash everything that determines the LLM response into a cache key. The
+    prompt prefix only marks part of the prompt as cacheable, so it is not
+    part of the key."""
+    request = json.dumps(
+        [
+            LLM_MODEL, model_class.__module__, model_class.__qualname__, get_gemini_schema(model_class),
+            prompt, media_digest.hex() if media_digest else None
+        ],
+        sort_keys=True
+    )
+    return blake2b(request.encode('utf-8'), digest_size=32).digest()
+
+
+def clear_response_cache() -> None:
+    """Discard all cached LLM responses."""
+    _response_cache.clear()
+
+
+async def classify_input(prompt: str, model_class: Type[T], media_data: Optional[list[str]] = None, prompt_prefix: Optional[str] = None) -> T | None:
+    """Classify a single text using the LLM with retry logic. Optionally includes
+    media. If the prompt starts with `prompt_prefix` (the static part of the
+    prompt template), the prefix is marked as cacheable by the provider.
+
+    Responses to identical requests are served from an in-process cache, and
+    identical requests made concurrently share a single LLM call. Set
+    `LLM_CLASSIFIER_RESPONSE_CACHE_SIZE=0` to disable both."""
     try:
-        async with asyncio.Semaphore(get_concurrency_limit()):
-            # Prepare messages based on whether media is included
-            if media_data and len(media_data) > 0:
-                # Create multimodal message format with content list
-                content: list[dict[str, object]] = [{"type": "text", "text": prompt}]
-                
-                # Add each media item as an image_url entry
-                for media_item in media_data:
-                    content.append({
-                        "type": "image_url",
-                        "image_url": {"url": media_item}
-                    })
-                
-                messages = [{"role": "user", "content": content}]
-            else:
-                # Text-only message format
-                messages = [{"role": "user", "content": prompt}]
-            
-            response = await acompletion(
-                model="openrouter/google/gemini-2.5-flash-preview",
-                messages=messages,
-                response_format={"type": "json_object", "response_schema": get_gemini_schema(model_class)}
-            )
-            assert isinstance(response, ModelResponse) and isinstance(response.choices[0], Choices), f"Response is not a ModelResponse: {type(response)}"
-            message_content = response.choices[0].message.content
-            assert isinstance(message_content, str), f"Message content is not a string: {type(message_content)}"
+        messages = build_messages(prompt, media_data, prompt_prefix)
+        if not RESPONSE_CACHE_SIZE:
+            message_content = await request_completion(messages, model_class)
             return get_model_from_json(message_content, model_class)
 
+        # Hash media in a worker thread, since it may be large
+        media_digest = await asyncio.to_thread(get_media_digest, media_data) if media_data else None
+        key = get_cache_key(prompt, media_digest, model_class)
+        lock = _response_locks.setdefault(key, asyncio.Lock())
+        _response_lock_users[key] = _response_lock_users.get(key, 0) + 1
+        try:
+            async with lock:
+                cached = _response_cache.get(key)
+                if cached is not None:
+                    _response_cache.move_to_end(key)
+                    return model_class.model_validate(cached)
+
+                message_content = await request_completion(messages, model_class)
+                result = get_model_from_json(message_content, model_class)
+                _response_cache[key] = result.model_dump()
+                if len(_response_cache) > RESPONSE_CACHE_SIZE:
+                    _response_cache.popitem(last=False)
+                return result
+        finally:
+            _response_lock_users[key] -= 1
+            if not _response_lock_users[key]:
+                del _response_lock_users[key]
+                del _response_locks[key]
+
     except Exception as e:
         print(f"Error during classification: {str(e)}")
         return None
 
 
-async def process_single_input(input_id: int, prompt_template: str, model_class: Type[T], session: Session) -> bool:
-    """Process and persist classification for a single input"""
+@lru_cache(maxsize=64)
+def get_prompt_renderer(prompt_template: str, model: Type[SQLModel]) -> Callable[[SQLModel], str]:
+    """Build a function that formats the prompt template with an input's
+    fields. The template is validated against the model once, when the
+    renderer is built, rather than for every input."""
+    placeholders = get_placeholders(prompt_template, model)
+    getters = [(placeholder, attrgetter(placeholder)) for placeholder in placeholders]
+
+    def render(input: SQLModel) -> str:
+        return prompt_template.format_map({placeholder: getter(input) for placeholder, getter in getters})
+
+    return render
+
+
+def encode_media(field_name: str, field_value: bytes) -> str:
+    """Encode media bytes as a base64 data URL, guessing the MIME type from the
+    field name."""
+    mime_type = mimetypes.guess_type(field_name)[0] or 'application/octet-stream'
+    # Encode in chunks so the GIL can be released between them when running in
+    # a worker thread
+    view = memoryview(field_value)
+    encoded = b"".join(
+        base64.b64encode(view[start:start + MEDIA_ENCODE_CHUNK_SIZE])
+        for start in range(0, len(view), MEDIA_ENCODE_CHUNK_SIZE)
+    )
+    return f"data:{mime_type};base64,{encoded.decode('ascii')}"
+
+
+def get_media_fields(input: SQLModel) -> list[tuple[str, bytes]]:
+    """Find all bytes fields in the input. Values are read through the model's
+    declared fields rather than the instance `__dict__`, which is empty once
+    the instance has expired."""
+    return [
+        (field_name, field_value)
+        for field_name in type(input).model_fields
+        if isinstance(field_value := getattr(input, field_name), bytes)
+    ]
+
+
+def get_media_data(media_fields: list[tuple[str, bytes]]) -> list[str]:
+    """Encode media fields as base64 data URLs."""
+    return [encode_media(field_name, field_value) for field_name, field_value in media_fields]
+
+
+async def process_single_input(input_id: int, prompt_template: str, model_class: Type[T], session: Session, commit: bool = True) -> bool:
+    """Process and persist classification for a single input. With `commit`
+    set to False, the response is added to the session but left for the
+    caller to commit."""
     input: ClassificationInput | None = session.exec(
         select(ClassificationInput)
         .where(ClassificationInput.id == input_id)
@@ -92,38 +279,135 @@ async def process_single_input(input_id: int, prompt_template: str, model_class:
     if not input:
         raise ValueError(f"Input with id {input_id} not found")
 
-    dynamic_placeholders = get_placeholders(prompt_template, type(input))
-    format_args = {placeholder: getattr(input, placeholder) for placeholder in dynamic_placeholders}
-    current_prompt = prompt_template.format(**format_args)
+    # Skip already-classified inputs before doing any work
+    existing_response = session.exec(
+        select(ClassificationResponse.id)
+        .where(ClassificationResponse.input_id == input_id)
+    ).first()
+    if existing_response:
+        return True
+
+    return await process_loaded_input(input, prompt_template, model_class, session, commit=commit)
+
+
+async def process_loaded_input(input: ClassificationInput, prompt_template: str, model_class: Type[T], session: Session, commit: bool = True) -> bool:
+    """Process and persist classification for an input already loaded from
+    the database. The caller is responsible for skipping inputs that have
+    already been classified."""
+    current_prompt = get_prompt_renderer(prompt_template, type(input))(input)
     
-    # Find all bytes fields in the input and encode them as base64
-    media_data = []
-    for field_name, field_value in input.__dict__.items():
-        if isinstance(field_value, bytes):
-            # Guess the MIME type and encode to base64
-            mime_type = mimetypes.guess_type(field_name)[0] or 'application/octet-stream'
-            encoded_data = f"data:{mime_type};base64,{base64.b64encode(field_value).decode('utf-8')}"
-            media_data.append(encoded_data)
+    # Encode bytes fields in a worker thread so large media does not block
+    # the event loop. The fields are read here, since loading an expired
+    # attribute queries the session, which must stay on this thread. This runs
+    # before waiting on the concurrency limit, so encoding for a whole batch
+    # proceeds in the thread pool while earlier requests are in flight.
+    media_data: list[str] = []
+    media_fields = get_media_fields(input)
+    if media_fields:
+        media_data = await asyncio.to_thread(get_media_data, media_fields)
     
     try:
         # Pass None if no media data, otherwise pass the list of encoded media
-        result = await classify_input(current_prompt, model_class, media_data if media_data else None)
+        result = await classify_input(
+            current_prompt,
+            model_class,
+            media_data if media_data else None,
+            prompt_prefix=cached_template_prefix(prompt_template)
+        )
         
         if result:
-            existing_input = session.exec(
-                select(ClassificationResponse)
-                .where(ClassificationResponse.input_id == input_id)
-            ).first()
-
-            if not existing_input:
-                input.classification_response = ClassificationResponse(
-                    **result.model_dump()
-                )
-                session.add(input)
+            # Add the response by foreign key rather than through the
+            # relationship, which would lazy-load the input's old response
+            session.add(ClassificationResponse(
+                **result.model_dump(exclude={'input_id'}),
+                input_id=input.id
+            ))
+            if commit:
                 session.commit()
             return True
         return False
     except Exception as e:
-        print(f"Error processing input {input_id}: {e}")
+        print(f"Error processing input {input.id}: {e}")
         return False
 
+
+async def classify_inputs(input_ids: Sequence[int], prompt_template: str, model_class: Type[T], session: Session, commit_every: int = 50) -> list[bool]:
+    """Classify and persist a batch of inputs concurrently. Concurrency is
+    bounded by the shared semaphore in `classify_input`, and responses are
+    committed in batches of `commit_every`.
+
+    Returns a success flag for each input id, in the order given. Inputs whose
+    batch fails to commit are reported as failed.
+    """
+    # Keep the prefetched inputs loaded across the batch commits
+    expire_on_commit = session.expire_on_commit
+    session.expire_on_commit = False
+    try:
+        return await classify_loaded_inputs(input_ids, prompt_template, model_class, session, commit_every)
+    finally:
+        session.expire_on_commit = expire_on_commit
+
+
+async def classify_loaded_inputs(input_ids: Sequence[int], prompt_template: str, model_class: Type[T], session: Session, commit_every: int) -> list[bool]:
+    """Classify a batch of inputs for `classify_inputs`, which is responsible
+    for keeping the session's instances from expiring between commits."""
+    # Load the inputs and find those already classified up front, rather than
+    # querying for each input separately
+    inputs: dict[int | None, ClassificationInput] = {}
+    classified: set[int | None] = set()
+    for id_batch in batched(input_ids, IN_CLAUSE_BATCH_SIZE):
+        inputs.update(
+            (input.id, input) for input in session.exec(
+                select(ClassificationInput)
+                .where(col(ClassificationInput.id).in_(id_batch))
+            )
+        )
+        classified.update(session.exec(
+            select(col(ClassificationResponse.input_id))
+            .where(col(ClassificationResponse.input_id).in_(id_batch))
+        ))
+
+    # Inputs whose responses were added since the last commit, so they can be
+    # marked as failed if that commit is rolled back
+    pending: list[int] = []
+    results: dict[int, bool] = {}
+
+    def commit() -> None:
+        try:
+            session.commit()
+        except Exception as e:
+            print(f"Error committing classifications: {e}")
+            session.rollback()
+            results.update((input_id, False) for input_id in pending)
+        pending.clear()
+
+    async def classify_one(input_id: int) -> None:
+        if input_id in classified:
+            results[input_id] = True
+            return
+        input = inputs.get(input_id)
+        if not input:
+            print(f"Error processing input {input_id}: Input with id {input_id} not found")
+            results[input_id] = False
+            return
+        try:
+            success = await process_loaded_input(input, prompt_template, model_class, session, commit=False)
+        except Exception as e:
+            print(f"Error processing input {input_id}: {e}")
+            success = False
+        results[input_id] = success
+        if success:
+            pending.append(input_id)
+            if len(pending) >= commit_every:
+                commit()
+
+    # Classify each distinct input once, so duplicate ids cannot race to
+    # create two responses
+    unique_ids = list(dict.fromkeys(input_ids))
+    # The task group cancels any in-flight requests if the batch is cancelled
+    # or a task fails unexpectedly
+    async with asyncio.TaskGroup() as task_group:
+        for input_id in unique_ids:
+            task_group.create_task(classify_one(input_id))
+    commit()
+    return [results[input_id] for input_id in input_ids]
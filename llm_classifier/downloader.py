@@ -1,8 +1,13 @@
 # downloader.py
 
-from typing import Sequence, Any, Protocol, Optional
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Generator, Iterable, Iterator, Sequence, Any, Protocol, Optional
 from dotenv import load_dotenv
-from sqlmodel import Session
+from sqlalchemy import insert
+from sqlalchemy.sql.dml import ReturningInsert
+from sqlalchemy.orm import object_session
+from sqlmodel import Session, col
 
 from llm_classifier.database import InputType, ClassificationInput
 
@@ -12,8 +17,9 @@ load_dotenv(override=True)
 class Downloader(Protocol):
     """Interface for different download approaches"""
     @classmethod
-    def get_records(cls, input_type: InputType) -> list[ClassificationInput]:
-        """Bulk download approach - override this for APIs that return full data in one call"""
+    def get_records(cls, input_type: InputType) -> Iterable[ClassificationInput]:
+        """Bulk download approach - override this for APIs that return full data in one call.
+        May be a generator, so records are built only as each batch is saved."""
         return []
 
     @classmethod
@@ -23,46 +29,159 @@ class Downloader(Protocol):
 
     @classmethod
     def get_record(cls, record_id: Any, input_type: InputType) -> Optional[ClassificationInput]:
-        """Override this for list-based APIs that need per-record detail calls"""
+        """Override this for list-based APIs that need per-record detail calls.
+        If `download_data` is given `max_workers` > 1, this is called
+        concurrently from worker threads, so it must be thread-safe and must
+        not use the session. The input type passed in is then a copy that is
+        not attached to the session."""
         return None
 
 
+def fetch_record(
+    downloader: type[Downloader],
+    record_id: Any,
+    input_type: InputType
+) -> Optional[ClassificationInput]:
+    """Fetch a single record, printing and skipping it if the download fails."""
+    try:
+        return downloader.get_record(record_id, input_type)
+    except Exception as e:
+        print(f"Error processing record: {e}")
+        return None
+
+
+def get_detached_input_type(input_type: InputType) -> InputType:
+    """Copy an input type into a new instance outside the session, which
+    worker threads can read and attach records to without using the session."""
+    return InputType(id=input_type.id, name=input_type.name)
+
+
+def fetch_records(
+    executor: ThreadPoolExecutor,
+    downloader: type[Downloader],
+    record_ids: Iterable[Any],
+    input_type: InputType,
+    window: int
+) -> Iterator[Optional[ClassificationInput]]:
+    """Fetch records in the executor's threads, yielding them in order. At
+    most `window` fetches are submitted ahead of the consumer, and any not yet
+    started are cancelled if the consumer stops early."""
+    futures: deque[Future[Optional[ClassificationInput]]] = deque()
+    try:
+        for record_id in record_ids:
+            futures.append(executor.submit(fetch_record, downloader, record_id, input_type))
+            if len(futures) >= window:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
 def download_data(
     session: Session,
     input_types: Sequence[InputType],
-    downloader: type[Downloader]
-) -> Sequence[int]:
-    """Download data using the provided strategy, persisting each record to the
-    database. We upload the records to the database one at a time rather than in
-    bulk to avoid memory management issues.
+    downloader: type[Downloader],
+    commit_interval: int = 100,
+    max_workers: int = 1
+) -> Generator[int, None, None]:
+    """Download data using the provided strategy, persisting the records to
+    the database in batches of `commit_interval` rather than all at once to
+    avoid memory management issues.
+
+    With the per-record strategy, records are fetched one at a time in the
+    calling thread by default. Set `max_workers` above 1 to download that many
+    records concurrently in threads, for downloaders whose `get_record` is
+    thread-safe. Records are still saved from the calling thread, since the
+    session is not thread-safe.
 
-    Returns a list of database ids for the created database records.
+    Yields the database ids of the created records as each batch is saved.
+    Each input type's records are only downloaded as the ids are consumed.
     """
-    ids: list[int] = []
-    for input_type in input_types:
-        # Use bulk download if the downloader defines its own get_records method
-        if "get_records" in downloader.__dict__:
-            records = downloader.get_records(input_type)
-        else:
-            records = downloader.get_record_ids(input_type)
-
-        for record in records:
-            try:
-                downloaded_data: ClassificationInput | None
-                if isinstance(record, ClassificationInput):
-                    downloaded_data = record
-                else:
-                    downloaded_data = downloader.get_record(record, input_type)
-
-                if downloaded_data is None:
+    # Use bulk download if the downloader defines its own get_records method
+    bulk = "get_records" in downloader.__dict__
+
+    batch: list[ClassificationInput] = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for input_type in input_types:
+            records: Iterable[Optional[ClassificationInput]]
+            if bulk:
+                records = downloader.get_records(input_type)
+            elif max_workers <= 1:
+                records = (
+                    fetch_record(downloader, record_id, input_type)
+                    for record_id in downloader.get_record_ids(input_type)
+                )
+            else:
+                # Keep a couple of fetches queued per worker while the
+                # calling thread saves records
+                records = fetch_records(
+                    executor,
+                    downloader,
+                    downloader.get_record_ids(input_type),
+                    get_detached_input_type(input_type),
+                    window=2 * max_workers
+                )
+
+            for record in records:
+                if record is None:
                     continue
 
-                session.add(downloaded_data)
-                session.commit()
-                assert downloaded_data.id
-                ids.append(downloaded_data.id)
-            except Exception as e:
-                print(f"Error processing record: {e}")
-                session.rollback()
+                batch.append(record)
+                if len(batch) >= commit_interval:
+                    yield from save_records(session, batch)
+                    batch = []
+
+    yield from save_records(session, batch)
+
+
+def get_insert_row(record: ClassificationInput) -> dict[str, Any]:
+    """Convert a record to a row of column values for a bulk insert."""
+    row = record.model_dump()
+    # Let the database assign ids unless the downloader provided them
+    if row["id"] is None:
+        del row["id"]
+    # Downloaders may set the input type via the relationship rather than the
+    # foreign key, which model_dump does not include
+    if record.input_type is not None:
+        row["input_type_id"] = record.input_type.id
+        # The record is inserted without going through the ORM, so discard its
+        # pending addition to the input type's collection
+        session = object_session(record.input_type)
+        if session is not None:
+            session.expire(record.input_type, ["classification_inputs"])
+    return row
+
+
+def save_records(session: Session, records: Sequence[ClassificationInput]) -> list[int]:
+    """Persist records with a single bulk INSERT ... RETURNING in one
+    transaction. If the transaction fails, the records are retried one at a
+    time so a bad record does not discard the rest of the batch.
+
+    Returns a list of database ids for the saved records.
+    """
+    if not records:
+        return []
+
+    # Inserted rows always have an id, though the model's field is optional
+    statement: ReturningInsert[tuple[int]] = insert(ClassificationInput).returning(
+        col(ClassificationInput.id), sort_by_parameter_order=True
+    )
+    rows = [get_insert_row(record) for record in records]
+    try:
+        ids = list(session.scalars(statement, rows))
+        session.commit()
+        return ids
+    except Exception:
+        session.rollback()
 
+    ids = []
+    for row in rows:
+        try:
+            ids.extend(session.scalars(statement, [row]))
+            session.commit()
+        except Exception as e:
+            print(f"Error processing record: {e}")
+            session.rollback()
     return ids
@@ -1,5 +1,6 @@
 # parser.py
 
+from functools import lru_cache
 from typing import Type, TypeVar
 from pydantic import BaseModel
 from llm_classifier.validators import get_json
@@ -10,12 +11,18 @@ T = TypeVar('T', bound=BaseModel)
 
 def get_model_from_json(content: str, model_class: Type[T]) -> T:
     """Parse JSON from LLM response, handling both direct JSON and markdown-fenced output."""
-    parsed_json = get_json(content)
-    return model_class.model_validate(parsed_json)
+    # Validate from a dict: SQLModel skips validation for table models in
+    # model_validate_json, but not in model_validate
+    return model_class.model_validate(get_json(content))
 
 
+@lru_cache(maxsize=64)
 def get_gemini_schema(model_class: Type[T]) -> dict:
-    """Convert a Pydantic/SQLModel schema to Gemini-compatible format."""
+    """Convert a Pydantic/SQLModel schema to Gemini-compatible format.
+
+    The schema is cached per model class and must not be mutated. Call
+    `get_gemini_schema.cache_clear()` if a model class is redefined.
+    """
     schema = model_class.model_json_schema()
     
     def get_type_info(field_info: dict) -> dict:
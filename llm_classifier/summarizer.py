@@ -1,12 +1,17 @@
 # summarizer.py
 
 import csv
-from datetime import datetime
+from datetime import date
+from functools import lru_cache
+from itertools import chain, count
 from pathlib import Path
-from sqlmodel import Session, select, col
+from sqlalchemy.orm import contains_eager
+from sqlmodel import Session, select, col, func
+from sqlmodel.sql.expression import SelectOfScalar
 from typing import Sequence, Any
-from llm_classifier.database import ClassificationResponse, ClassificationInput
-from statistics import mean, median, stdev
+from llm_classifier.database import ClassificationResponse, ClassificationInput, InputType
+from math import fsum, sqrt
+from statistics import fmean, median
 
 STATS_TEMPLATE = """
 Summary Statistics:
@@ -15,22 +20,33 @@ Mean: {mean:.2f}
 Median: {median}
 Standard Deviation: {std}"""
 
+# Number of rows fetched per round trip when streaming the CSV export
+EXPORT_BATCH_SIZE = 1000
+
+def sample_stdev(numeric_sequence: Sequence[float], mean: float) -> float:
+    """Sample standard deviation computed in floating point around a known mean.
+
+    statistics.stdev works in exact fractions, which is far slower for long
+    sequences than this two-pass fsum.
+    """
+    squared_deviations = fsum((x - mean) ** 2 for x in numeric_sequence)
+    return sqrt(squared_deviations / (len(numeric_sequence) - 1))
+
+
+def format_stats(total: int, mean: float, median: float, std: float | None) -> str:
+    """Format precomputed summary statistics."""
+    std_text = f"{std:.2f}" if std is not None else "N/A (need more than one value)"
+    return STATS_TEMPLATE.format(total=total, mean=mean, median=median, std=std_text)
+
+
 def format_stats_summary(numeric_sequence: Sequence[float]) -> str:
     """Format a statistical summary for a numeric field."""
     if not numeric_sequence:
         return "No processed inputs found."
 
-    try:
-        std_text = f"{stdev(numeric_sequence):.2f}"
-    except:
-        std_text = "N/A (need more than one value)"
-
-    return STATS_TEMPLATE.format(
-        total=len(numeric_sequence),
-        mean=mean(numeric_sequence),
-        median=median(numeric_sequence),
-        std=std_text
-    )
+    mean = fmean(numeric_sequence)
+    std = sample_stdev(numeric_sequence, mean) if len(numeric_sequence) > 1 else None
+    return format_stats(len(numeric_sequence), mean, median(numeric_sequence), std)
 
 
 def format_distribution(numeric_sequence: Sequence[float], breakpoints: int = 5) -> str:
@@ -49,24 +65,77 @@ def format_distribution(numeric_sequence: Sequence[float], breakpoints: int = 5)
     return "\n".join(lines)
 
 
-def get_numeric_sequence(session: Session, numeric_field: str) -> Sequence[float]:
+def get_processed_input_ids(today: date | None = None) -> Any:
+    """Build a subquery for the ids of inputs processed on or after `today`,
+    which defaults to the current date in the system timezone."""
+    return select(ClassificationInput.id).where(
+        ClassificationInput.processed_date >= (today or date.today())
+    )
+
+
+def get_processed_responses(numeric_field: str, today: date | None = None) -> Any:
+    """Build a query for a response field, restricted to processed inputs."""
+    return select(getattr(ClassificationResponse, numeric_field)).where(
+        col(ClassificationResponse.input_id).in_(get_processed_input_ids(today))
+    )
+
+
+def get_numeric_sequence(
+    session: Session, numeric_field: str, today: date | None = None
+) -> Sequence[float]:
     """Retrieve all valid numeric values from the processed inputs."""
-    today = datetime.now().date()  # Get current date in system timezone
     results: Sequence[int | float] = session.exec(
-        select(getattr(ClassificationResponse, numeric_field))
-        .where(
-            col(ClassificationResponse.input_id).in_(
-                select(ClassificationInput.id).where(
-                    ClassificationInput.processed_date >= today
-                )
-            )
-        )
+        get_processed_responses(numeric_field, today)
     ).all()
     return results
 
 
+def get_numeric_summary(
+    session: Session, numeric_field: str, today: date | None = None
+) -> tuple[int, float, float, float | None] | None:
+    """Compute count, mean, median and sample standard deviation in SQL.
+
+    Only the aggregates and the one or two middle values are transferred,
+    rather than the whole column. Returns None if there are no values.
+    """
+    values = get_processed_responses(numeric_field, today).where(
+        getattr(ClassificationResponse, numeric_field).is_not(None)
+    ).subquery()
+    value = values.c[0]
+    # Sum squared deviations from the mean, rather than using a standard
+    # deviation function that not every database (e.g. SQLite) provides
+    deviation = value - select(func.avg(value)).scalar_subquery()
+    total, mean, squared_deviations = session.exec(  # type: ignore
+        select(func.count(value), func.avg(value), func.sum(deviation * deviation))
+    ).one()
+
+    if not total:
+        return None
+    std = sqrt(squared_deviations / (total - 1)) if total > 1 else None
+
+    middle_values = session.exec(  # type: ignore
+        select(value).order_by(value)
+        .offset((total - 1) // 2)
+        .limit(2 - total % 2)
+    ).all()
+    return total, mean, median(middle_values), std
+
+
 def print_summary_statistics(session: Session, numeric_field: str, breakpoints: int = 5) -> None:
-    """Print summary statistics for a numeric field."""
+    """Print summary statistics for a numeric field.
+
+    With breakpoints=0 the percentile distribution is skipped and the summary
+    is computed in SQL without fetching the column. Otherwise the column is
+    fetched once and both are computed from it.
+    """
+    if not breakpoints:
+        summary = get_numeric_summary(session, numeric_field)
+        if summary is None:
+            print("No processed inputs found.")
+            return
+        print(format_stats(*summary))
+        return
+
     numeric_sequence: Sequence[float] = get_numeric_sequence(session, numeric_field)
     
     if not numeric_sequence:
@@ -77,41 +146,96 @@ def print_summary_statistics(session: Session, numeric_field: str, breakpoints:
     print(format_distribution(numeric_sequence, breakpoints=breakpoints))
 
 
+def get_filtered_query(
+    where_clauses: list[Any] | None = None,
+    today: date | None = None
+) -> SelectOfScalar[ClassificationResponse]:
+    """Build a query for responses to inputs processed today.
+
+    The related ClassificationInput is loaded from the same join, so reading
+    `classification_input` on a result doesn't issue another query.
+
+    Args:
+        where_clauses: List of SQLAlchemy filter clauses
+        today: Earliest processed date to include, defaulting to the current date
+    """
+    query = (
+        select(ClassificationResponse)
+        .join(ClassificationInput)
+        .where(ClassificationInput.processed_date >= (today or date.today()))
+        .options(contains_eager(ClassificationResponse.classification_input))  # type: ignore
+    )
+
+    if where_clauses:
+        query = query.where(*where_clauses)
+
+    return query
+
+
 def get_filtered_responses(
     session: Session,
-    where_clauses: list[Any] | None = None
+    where_clauses: list[Any] | None = None,
+    today: date | None = None
 ) -> Sequence[ClassificationResponse]:
     """Retrieve filtered results from processed inputs.
     
     Args:
         session: Database session
         where_clauses: List of SQLAlchemy filter clauses
+        today: Earliest processed date to include, defaulting to the current date
     """
-    today = datetime.now().date()
-    query = select(ClassificationResponse).join(ClassificationInput).where(
-        ClassificationInput.processed_date >= today
-    )
-    
-    if where_clauses:
-        query = query.where(*where_clauses)
-        
-    results: Sequence[ClassificationResponse] = session.exec(query).all()
+    results: Sequence[ClassificationResponse] = session.exec(
+        get_filtered_query(where_clauses, today)
+    ).all()
     return results
 
 
+@lru_cache(maxsize=64)
 def get_exportable_fields(model_class: type[ClassificationResponse]) -> list[str]:
-    """Get list of fields to export, excluding internal fields."""
+    """Get list of fields to export, excluding internal fields. The list is
+    cached per model class and must not be mutated."""
     return [
         f for f in model_class.model_fields 
         if f not in ["id", "input_id", "classification_input"]
     ]
 
 
+def get_export_query(
+    input_fields: Sequence[str],
+    response_fields: Sequence[str],
+    where_clauses: list[Any] | None = None,
+    today: date | None = None
+) -> Any:
+    """Build a Core query selecting the export columns as plain rows.
+
+    Rows are read without building ORM objects. `input_type` exports the name
+    of the input's type.
+    """
+    input_columns = [
+        col(InputType.name) if field == "input_type" else getattr(ClassificationInput, field)
+        for field in input_fields
+    ]
+    response_columns = [getattr(ClassificationResponse, field) for field in response_fields]
+    query = (
+        select(*input_columns, *response_columns)  # type: ignore
+        .select_from(ClassificationResponse)
+        .join(ClassificationInput)
+        .outerjoin(InputType)
+        .where(ClassificationInput.processed_date >= (today or date.today()))
+    )
+
+    if where_clauses:
+        query = query.where(*where_clauses)
+
+    return query
+
+
 def export_responses(
     session: Session,
     output_csv: str | Path,
     where_clauses: list[Any] | None = None,
-    input_fields: list[str] = ["id", "processed_date", "input_type"]
+    input_fields: list[str] = ["id", "processed_date", "input_type"],
+    today: date | None = None
 ) -> None:
     """Export filtered findings to CSV.
     
@@ -120,22 +244,24 @@ def export_responses(
         output_csv: Path to output CSV file
         where_clauses: List of SQLAlchemy where clauses for filtering
         input_fields: List of fields to include from related ClassificationInput
+        today: Earliest processed date to include, defaulting to the current date
     """
-    results = get_filtered_responses(session, where_clauses)
-    
-    if results:
-        fields = get_exportable_fields(ClassificationResponse)
-        fields = input_fields + fields
-        
+    fields = input_fields + get_exportable_fields(ClassificationResponse)
+    response_fields = [f for f in fields if f not in input_fields]
+    query = get_export_query(
+        input_fields, response_fields, where_clauses, today
+    ).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    rows = iter(session.exec(query))
+    first = next(rows, None)
+
+    if first is not None:
+        # Counts the rows as writerows consumes them
+        row_count = count()
         with open(output_csv, 'w', newline='', encoding='utf-8') as csvfile:
             csv_writer = csv.writer(csvfile)
             csv_writer.writerow(fields)
-            rows = []
-            for r in results:
-                row = [getattr(r.classification_input, field) for field in input_fields]
-                row.extend(getattr(r, field) for field in fields if field not in input_fields)
-                rows.append(row)
-            csv_writer.writerows(rows)
-        print(f"\nExported {len(results)} filtered findings to {output_csv}")
+            csv_writer.writerows(row for row, _ in zip(chain([first], rows), row_count))
+        exported = next(row_count)
+        print(f"\nExported {exported} filtered findings to {output_csv}")
     else:
-        print("\nNo matching findings found")
\ No newline at end of file
+        print("\nNo matching findings found")
@@ -2,18 +2,27 @@
 
 import re
 import json
+from functools import lru_cache
+from string import Formatter
+from pydantic_core import from_json
 from sqlmodel import SQLModel
 from typing import Type, Any
 from llm_classifier.database import ClassificationInput
 from llm_classifier.prompt import PROMPT_TEMPLATE
 
 
+PLACEHOLDER_PATTERN = re.compile(r'\{(\w+)\}')
+JSON_FENCE_PATTERN = re.compile(r'```\s*json\s*(.*?)\s*```', re.DOTALL | re.IGNORECASE)
+JSON_ERROR_POSITION_PATTERN = re.compile(r'(.*) at line (\d+) column (\d+)$', re.DOTALL)
+
+
 class TemplateError(ValueError):
     """Raised when there's an error with the prompt template"""
     def __init__(self, col: str, model: Type[SQLModel]):
         super().__init__(f"Column '{col}' in prompt template not found in {model.__name__} model.")
 
 
+@lru_cache(maxsize=64)
 def get_placeholders(
         prompt_template: str=PROMPT_TEMPLATE,
         model: Type[SQLModel]=ClassificationInput
@@ -31,12 +40,13 @@ def get_placeholders(
         model: SQLModel class to validate fields against
 
     Returns:
-        List of placeholder names found in the template
+        List of placeholder names found in the template. Results are cached
+        per template and model, so callers must not mutate the list.
 
     Raises:
         TemplateError: If template contains invalid fields or missing required fields
     """
-    placeholders = re.findall(r'\{(\w+)\}', prompt_template)
+    placeholders = PLACEHOLDER_PATTERN.findall(prompt_template)
 
     # Get the model fields from SQLModel
     model_fields = model.model_fields
@@ -63,12 +73,52 @@ def get_placeholders(
     return placeholders
 
 
-def get_json(content: str) -> Any:
-    """Extract JSON content from markdown code fence if present."""
-    match = re.search(r'```\s*json\s*(.*?)\s*```', content, re.DOTALL | re.IGNORECASE)
+def get_template_prefix(prompt_template: str) -> str:
+    """
+    Get the static text preceding the first placeholder in a prompt template,
+    as it appears in the formatted prompt (i.e., with escaped braces resolved).
+
+    Every prompt formatted from the template starts with this prefix, so it
+    can be cached by the LLM provider across requests.
+    """
+    prefix = []
+    for literal_text, field_name, _, _ in Formatter().parse(prompt_template):
+        prefix.append(literal_text)
+        if field_name is not None:
+            break
+    return "".join(prefix)
+
+
+def get_json_text(content: str) -> str:
+    """Extract the JSON text from a markdown code fence if present, otherwise
+    strip surrounding whitespace and quotes."""
+    match = JSON_FENCE_PATTERN.search(content)
     if match:
-        return json.loads(match.group(1).strip())
-    return json.loads(content.strip().strip('"\''))
+        return match.group(1).strip()
+    return content.strip().strip('"\'')
+
+
+def get_json(content: str) -> Any:
+    """Extract JSON content from markdown code fence if present.
+
+    Raises json.JSONDecodeError if the content is not valid JSON.
+    """
+    text = get_json_text(content)
+    try:
+        return from_json(text)
+    except ValueError as e:
+        raise get_json_decode_error(str(e), text) from e
+
+
+def get_json_decode_error(message: str, text: str) -> json.JSONDecodeError:
+    """Convert a pydantic-core JSON error, which reports a line and column,
+    into the json.JSONDecodeError the stdlib parser raises."""
+    match = JSON_ERROR_POSITION_PATTERN.match(message)
+    if not match:
+        return json.JSONDecodeError(message, text, 0)
+    line, column = int(match.group(2)), int(match.group(3))
+    line_start = sum(len(line_text) + 1 for line_text in text.split('\n')[:line - 1])
+    return json.JSONDecodeError(match.group(1), text, min(line_start + max(column - 1, 0), len(text)))
 
 if __name__ == "__main__":
     print(get_placeholders())
\ No newline at end of file
@@ -7,12 +7,14 @@ if __name__ == "__main__":
     from dotenv import load_dotenv
     from datetime import date
     import requests
-    from typing import override
-    from sqlmodel import Session, select
-    from sqlalchemy import inspect
+    from requests.adapters import HTTPAdapter
+    from pydantic_core import from_json
+    from typing import Iterator, override
+    from sqlalchemy import Engine
+    from sqlmodel import Session, select, col
     from llm_classifier.database import init_database, seed_input_types, ClassificationInput, ClassificationResponse, InputType
     from llm_classifier.downloader import download_data, Downloader
-    from llm_classifier.classifier import process_single_input
+    from llm_classifier.classifier import classify_inputs
     from llm_classifier.prompt import PROMPT_TEMPLATE
     from llm_classifier.summarizer import print_summary_statistics, export_responses
 
@@ -23,16 +25,35 @@ if __name__ == "__main__":
         `get_records` method (bulk download strategy) or the `get_record_ids`
         and `get_record` methods (per-record download strategy) of the
         `Downloader` class (see `downloader.py`)."""
+        # Shared HTTP session, so repeated requests reuse open connections
+        http = requests.Session()
+        http.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32))
+
         @classmethod
         @override
-        def get_records(cls, input_type: InputType) -> list[ClassificationInput]:
-            response = requests.get('https://jsonplaceholder.typicode.com/posts')
+        def get_records(cls, input_type: InputType) -> Iterator[ClassificationInput]:
+            response = cls.http.get('https://jsonplaceholder.typicode.com/posts')
             response.raise_for_status()
-            return [ClassificationInput(
-                **record,
-                processed_date=date.today(),
-                input_type_id=input_type.id,
-            ) for record in response.json()]
+            today = date.today()
+            input_type_id = input_type.id
+            # Build the records lazily, so only one batch exists at a time
+            for record in from_json(response.content):
+                yield ClassificationInput(
+                    **record,
+                    processed_date=today,
+                    input_type_id=input_type_id,
+                )
+
+    def run_reports(engine: Engine) -> None:
+        """Print summary statistics and export findings to CSV. Opens its own
+        session, so it can run in a worker thread."""
+        with Session(engine) as session:
+            print_summary_statistics(session, numeric_field="sentiment", breakpoints=5)
+            export_responses(
+                session,
+                "responses.csv",
+                input_fields=["id", "processed_date", "input_type", "title", "body"]
+            )
 
     async def main() -> None:
         # Initialize database
@@ -44,36 +65,28 @@ if __name__ == "__main__":
             seed_input_types(session, input_types=INPUT_TYPES)
         
             # Select input types
-            name_col = inspect(InputType).columns["name"]
             input_types = session.exec(
-                select(InputType).where(name_col.in_(INPUT_TYPES))
+                select(InputType).where(col(InputType.name).in_(INPUT_TYPES))
             ).all()
 
             # Download inputs
-            ids = download_data(
+            ids = list(download_data(
                 session,
                 input_types=input_types,
                 downloader=CustomDownloader,
-            )
+            ))
 
             # Classify inputs concurrently
-            results = await asyncio.gather(*[process_single_input(input_id, PROMPT_TEMPLATE, ClassificationResponse, session) for input_id in ids])
+            results = await classify_inputs(ids, PROMPT_TEMPLATE, ClassificationResponse, session)
             
             # Count successful classifications
-            classified_count = sum(1 for result in results if result)
+            classified_count = sum(results)
             print(f"Successfully classified {classified_count} inputs")
 
-            # Print summary statistics
-            print_summary_statistics(
-                session, numeric_field="sentiment", breakpoints=5
-            )
-
-            # Export findings to CSV
-            export_responses(
-                session,
-                "responses.csv",
-                input_fields=["id", "processed_date", "input_type", "title", "body"]
-            )
+        # Run the reports in a worker thread, so the queries don't block the
+        # event loop. The worker gets its own session, since sessions are not
+        # thread-safe
+        await asyncio.to_thread(run_reports, engine)
         engine.dispose()
 
     asyncio.run(main())
\ No newline at end of file
@@ -19,19 +19,25 @@ class Response(SQLModel):
     reason_its_investable: str
 
 import pytest
-import os
-import tempfile
 from unittest.mock import patch
-from typing import Generator, List
+from typing import Any, Generator, List
 from datetime import datetime, timedelta
 from sqlmodel import Session, Field, SQLModel, select
-from sqlalchemy.engine import Engine
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine
 
 with patch("llm_classifier.prompt.Input", new=Input):
     with patch("llm_classifier.prompt.Response", new=Response):
         from llm_classifier.database import init_database, seed_input_types, ClassificationInput, ClassificationResponse
 
 # --- Fixtures ---
+@pytest.fixture(autouse=True)
+def clear_llm_response_cache() -> None:
+    """Fixture to keep cached LLM responses from leaking between tests."""
+    from llm_classifier.classifier import clear_response_cache
+    clear_response_cache()
+
+
 @pytest.fixture(scope="session")
 def mock_prompt_template() -> str:
     MOCK_PROMPT_TEMPLATE = (
@@ -44,19 +50,24 @@ def mock_prompt_template() -> str:
     return MOCK_PROMPT_TEMPLATE
 
 
-@pytest.fixture(scope="function")
-def test_db_path() -> Generator[str, None, None]:
-    """Fixture to provide a unique path for the test database."""
-    with tempfile.NamedTemporaryFile(suffix=".db", delete=False) as tmp_file:
-        tmp_path = tmp_file.name
-    yield tmp_path
-    os.remove(tmp_path)
-
-
-@pytest.fixture(scope="function")
-def test_engine(test_db_path: str) -> Generator[Engine, None, None]:
-    """Fixture to create an in-memory SQLite database engine for testing."""
-    engine = init_database(test_db_path)
+@pytest.fixture(scope="session")
+def test_engine() -> Generator[Engine, None, None]:
+    """Fixture to create an in-memory test database and schema once per run."""
+    engine = init_database(":memory:")
+
+    # pysqlite manages transactions itself and breaks SAVEPOINT; let SQLAlchemy
+    # emit BEGIN so each test's session can roll back
+    @event.listens_for(engine, "connect")
+    def disable_pysqlite_transactions(dbapi_connection: Any, connection_record: Any) -> None:
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def begin_transaction(connection: Connection) -> None:
+        connection.exec_driver_sql("BEGIN")
+
+    # Drop the connection opened by init_database before the listeners existed,
+    # which also discards the in-memory schema created with it
+    engine.dispose()
     # Create tables for BOTH mock models
     SQLModel.metadata.create_all(engine)
     yield engine
@@ -65,17 +76,15 @@ def test_engine(test_db_path: str) -> Generator[Engine, None, None]:
 
 @pytest.fixture
 def test_session(test_engine: Engine) -> Generator[Session, None, None]:
-    """Fixture to create a session for testing."""
-    with Session(test_engine) as session:
-        seed_input_types(session, input_types=["8-K", "10-K"])
-        # Delete all records from the database
-        inputs = session.exec(select(ClassificationInput)).all()
-        for inp in inputs:
-            session.delete(inp)
-        responses = session.exec(select(ClassificationResponse)).all()
-        for resp in responses:
-            session.delete(resp)
-        yield session
+    """Fixture to create a session whose changes are rolled back after the
+    test. Commits inside the test only release a savepoint within the outer
+    transaction."""
+    with test_engine.connect() as connection:
+        transaction = connection.begin()
+        with Session(bind=connection, join_transaction_mode="create_savepoint") as session:
+            seed_input_types(session, input_types=["8-K", "10-K"])
+            yield session
+        transaction.rollback()
 
 
 @pytest.fixture
@@ -154,14 +163,13 @@ def sample_responses() -> List[ClassificationResponse]:
 def test_session_with_sample_data(test_session: Session, sample_inputs: List[ClassificationInput], sample_responses: List[ClassificationResponse]) -> Generator[Session, None, None]:
     """Fixture to create sample data in the database."""
     # Add the inputs first.
-    for inp in sample_inputs:
-        test_session.add(inp)
-    test_session.commit()  # Commit to assign IDs
+    test_session.add_all(sample_inputs)
+    test_session.flush()  # Flush to assign IDs
 
     # Now that inputs have IDs, add the responses.
     for resp, inp in zip(sample_responses, sample_inputs):
         resp.input_id = inp.id  # Ensure input_id is set correctly
-        test_session.add(resp)
+    test_session.add_all(sample_responses)
 
     test_session.commit()
     yield test_session
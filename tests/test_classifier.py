@@ -3,29 +3,44 @@
 import pytest
 from unittest.mock import patch, AsyncMock
 import asyncio
+import base64
+import json
+from typing import Any
+from sqlalchemy import Engine, event
 from sqlmodel import select, Session
 from litellm import Choices, Message
 from litellm.files.main import ModelResponse
+from litellm.exceptions import APIConnectionError
+from tenacity import wait_none
 from llm_classifier.classifier import (
     classify_input,
-    process_single_input
+    classify_inputs,
+    encode_media,
+    get_media_data,
+    get_media_fields,
+    get_prompt_renderer,
+    process_single_input,
+    request_completion
 )
 from llm_classifier.database import ClassificationInput, ClassificationResponse
 
+# A response with a value for every field the LLM fills in, built from the
+# model's fields
+_EXCLUDED_FIELDS = {'id', 'input_id', 'classification_input'}
+_TEST_DATA = {
+    field: (5 if field_info.annotation == int else "test_value")
+    for field, field_info in ClassificationResponse.model_fields.items()
+    if field not in _EXCLUDED_FIELDS
+}
+_MOCK_CONTENT = json.dumps(_TEST_DATA)
+
 # Test classify_input
 @pytest.mark.asyncio
 async def test_classify_input() -> None:
-    # Create a dynamic test response using the model's fields
-    test_data = {
-        field: (5 if field_info.annotation == int else "test_value")
-        for field, field_info in ClassificationResponse.model_fields.items()
-        if field not in ('id', 'input_id', 'classification_input')
-    }
-    
     mock_response = ModelResponse(
         choices=[Choices(
             message=Message(
-                content=str(test_data).replace("'", '"')
+                content=_MOCK_CONTENT
             )
         )]
     )
@@ -34,14 +49,167 @@ async def test_classify_input() -> None:
         result = await classify_input("test prompt", ClassificationResponse)
         assert isinstance(result, ClassificationResponse)
         # Verify all fields are present
-        for field_name, expected_value in test_data.items():
+        for field_name, expected_value in _TEST_DATA.items():
             assert getattr(result, field_name) == expected_value
 
 @pytest.mark.asyncio
 async def test_classify_input_error() -> None:
-    with patch('llm_classifier.classifier.acompletion', AsyncMock(side_effect=Exception("API Error"))):
+    with patch('llm_classifier.classifier.acompletion', AsyncMock(side_effect=Exception("API Error"))) as mock_acompletion:
         result = await classify_input("test prompt", ClassificationResponse)
         assert result is None
+        # Non-transient errors are not retried
+        assert mock_acompletion.call_count == 1
+
+@pytest.mark.asyncio
+async def test_classify_input_retries_transient_errors() -> None:
+    mock_response = ModelResponse(choices=[Choices(message=Message(content=_MOCK_CONTENT))])
+    transient_error = APIConnectionError(message="Connection reset", llm_provider="openrouter", model="test")
+
+    with (
+        patch.object(request_completion.retry, 'wait', wait_none()),  # type: ignore[attr-defined]
+        patch('llm_classifier.classifier.acompletion', AsyncMock(side_effect=[transient_error, mock_response])) as mock_acompletion
+    ):
+        result = await classify_input("test prompt", ClassificationResponse)
+
+    assert isinstance(result, ClassificationResponse)
+    assert mock_acompletion.call_count == 2
+
+@pytest.mark.asyncio
+async def test_classify_input_marks_prompt_prefix_cacheable() -> None:
+    mock_response = ModelResponse(choices=[Choices(message=Message(content=_MOCK_CONTENT))])
+
+    with patch('llm_classifier.classifier.acompletion', AsyncMock(return_value=mock_response)) as mock_acompletion:
+        await classify_input("static prefix\ninput text", ClassificationResponse, prompt_prefix="static prefix\n")
+
+    content = mock_acompletion.call_args.kwargs["messages"][0]["content"]
+    assert content == [
+        {"type": "text", "text": "static prefix\n", "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": "input text"}
+    ]
+
+@pytest.mark.asyncio
+async def test_classify_input_respects_concurrency_limit() -> None:
+    in_flight = 0
+    max_in_flight = 0
+
+    async def mock_acompletion(*args: object, **kwargs: object) -> ModelResponse:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return ModelResponse(choices=[Choices(message=Message(content=_MOCK_CONTENT))])
+
+    with patch('llm_classifier.classifier.get_concurrency_limit', return_value=2), \
+            patch('llm_classifier.classifier._semaphore', None), \
+            patch('llm_classifier.classifier.acompletion', mock_acompletion):
+        results = await asyncio.gather(*[classify_input(f"test prompt {i}", ClassificationResponse) for i in range(6)])
+
+    assert all(isinstance(r, ClassificationResponse) for r in results)
+    assert max_in_flight == 2
+
+def test_get_prompt_renderer(mock_prompt_template: str) -> None:
+    input = ClassificationInput(input_text="Test filing", extra_field="extra")
+    render = get_prompt_renderer(mock_prompt_template, ClassificationInput)
+    assert render(input) == mock_prompt_template.format(input_text="Test filing", extra_field="extra")
+    # The renderer is built once per template and model
+    assert get_prompt_renderer(mock_prompt_template, ClassificationInput) is render
+
+def test_encode_media() -> None:
+    # Spans several encoding chunks and ends on a partial one
+    data = bytes(range(256)) * 2000
+    encoded = encode_media("image.png", data)
+    assert encoded == f"data:image/png;base64,{base64.b64encode(data).decode('utf-8')}"
+    assert encode_media("bytes_field", b"").startswith("data:application/octet-stream;base64,")
+
+def test_get_media_fields_of_expired_input(test_session: Session) -> None:
+    input = ClassificationInput(input_text="Test", extra_field="extra", bytes_field=b"media", input_type_id=1)
+    test_session.add(input)
+    test_session.commit()
+
+    # The commit expires the input, emptying its __dict__
+    assert get_media_fields(input) == [("bytes_field", b"media")]
+    assert get_media_data(get_media_fields(input)) == [encode_media("bytes_field", b"media")]
+
+@pytest.mark.asyncio
+async def test_classify_input_caches_identical_requests() -> None:
+    mock_response = ModelResponse(choices=[Choices(message=Message(content=_MOCK_CONTENT))])
+
+    with patch('llm_classifier.classifier.acompletion', AsyncMock(return_value=mock_response)) as mock_acompletion:
+        # Concurrent identical requests share one call, and later ones hit the cache
+        results = await asyncio.gather(*[classify_input("test prompt", ClassificationResponse) for _ in range(3)])
+        results.append(await classify_input("test prompt", ClassificationResponse))
+        assert mock_acompletion.call_count == 1
+
+        await classify_input("other prompt", ClassificationResponse)
+        assert mock_acompletion.call_count == 2
+
+    assert all(isinstance(r, ClassificationResponse) and r.score == 5 for r in results) # type: ignore
+
+@pytest.mark.asyncio
+async def test_classify_input_cache_hits_are_separate_rows(test_session: Session, sample_inputs: list[ClassificationInput]) -> None:
+    test_session.add_all(sample_inputs[:2])
+    test_session.commit()
+    mock_response = ModelResponse(choices=[Choices(message=Message(content=_MOCK_CONTENT))])
+
+    with patch('llm_classifier.classifier.acompletion', AsyncMock(return_value=mock_response)):
+        first = await classify_input("test prompt", ClassificationResponse)
+        second = await classify_input("test prompt", ClassificationResponse)
+
+    assert first is not None and second is not None
+    for response, input in zip((first, second), sample_inputs):
+        response.input_id = input.id
+        test_session.add(response)
+    test_session.commit()
+
+    assert len(test_session.exec(select(ClassificationResponse)).all()) == 2
+
+@pytest.mark.asyncio
+async def test_classify_input_keeps_lock_for_waiting_requests() -> None:
+    mock_response = ModelResponse(choices=[Choices(message=Message(content=_MOCK_CONTENT))])
+    call_count = 0
+
+    async def mock_acompletion(*args: object, **kwargs: object) -> ModelResponse:
+        nonlocal call_count
+        call_count += 1
+        await asyncio.sleep(0.01)
+        if call_count == 1:
+            raise Exception("first request failed")
+        return mock_response
+
+    with patch('llm_classifier.classifier.acompletion', mock_acompletion):
+        first = asyncio.create_task(classify_input("test prompt", ClassificationResponse))
+        waiting = asyncio.create_task(classify_input("test prompt", ClassificationResponse))
+        # The failed request releases the lock to the waiting one, which
+        # retries; a request arriving now must queue behind it
+        assert await first is None
+        later = asyncio.create_task(classify_input("test prompt", ClassificationResponse))
+        results = await asyncio.gather(waiting, later)
+
+    assert call_count == 2
+    assert all(isinstance(r, ClassificationResponse) for r in results)
+
+@pytest.mark.asyncio
+async def test_classify_input_without_response_cache() -> None:
+    mock_response = ModelResponse(choices=[Choices(message=Message(content=_MOCK_CONTENT))])
+
+    with patch('llm_classifier.classifier.RESPONSE_CACHE_SIZE', 0), \
+            patch('llm_classifier.classifier.acompletion', AsyncMock(return_value=mock_response)) as mock_acompletion:
+        await classify_input("test prompt", ClassificationResponse)
+        await classify_input("test prompt", ClassificationResponse)
+
+    assert mock_acompletion.call_count == 2
+
+@pytest.mark.asyncio
+async def test_classify_input_caches_by_media() -> None:
+    mock_response = ModelResponse(choices=[Choices(message=Message(content=_MOCK_CONTENT))])
+
+    with patch('llm_classifier.classifier.acompletion', AsyncMock(return_value=mock_response)) as mock_acompletion:
+        await classify_input("test prompt", ClassificationResponse, [encode_media("image.png", b"a")])
+        await classify_input("test prompt", ClassificationResponse, [encode_media("image.png", b"a")])
+        await classify_input("test prompt", ClassificationResponse, [encode_media("image.png", b"b")])
+
+    assert mock_acompletion.call_count == 2
 
 # Add fixture for sample inputs
 @pytest.fixture
@@ -60,12 +228,7 @@ async def test_process_single_input_with_gather(test_session: Session, sample_in
     test_session.commit()
 
     # Create a dynamic mock result
-    test_data = {
-        field: (5 if field_info.annotation == int else "test_value")
-        for field, field_info in ClassificationResponse.model_fields.items()
-        if field not in ('id', 'input_id', 'classification_input')
-    }
-    mock_result = ClassificationResponse(**test_data)
+    mock_result = ClassificationResponse(**_TEST_DATA)
 
     # Patch classify_input to return the mock result
     with patch('llm_classifier.classifier.classify_input', return_value=mock_result):
@@ -78,7 +241,7 @@ async def test_process_single_input_with_gather(test_session: Session, sample_in
     assert all(isinstance(r, ClassificationResponse) for r in results)
     # Verify all fields are present in each result
     for result in results:
-        for field_name, expected_value in test_data.items():
+        for field_name, expected_value in _TEST_DATA.items():
             assert getattr(result, field_name) == expected_value
 
 @pytest.mark.asyncio
@@ -94,7 +257,7 @@ async def test_process_single_input_duplicate_prevention(test_session: Session,
     )
     
     # Patch classify_input to return the mock result
-    with patch('llm_classifier.classifier.classify_input', return_value=mock_result):
+    with patch('llm_classifier.classifier.classify_input', return_value=mock_result) as mock_classify:
         # Pass the IDs of the sample inputs
         input_ids: list[int] = [input.id for input in sample_inputs if input.id is not None]
         assert all(input_ids)
@@ -103,6 +266,105 @@ async def test_process_single_input_duplicate_prevention(test_session: Session,
         results = await asyncio.gather(*[process_single_input(id, mock_prompt_template, ClassificationResponse, test_session) for id in input_ids])
         results = await asyncio.gather(*[process_single_input(id, mock_prompt_template, ClassificationResponse, test_session) for id in input_ids])
 
-    # Verify no duplicates were created
+    # Verify the second run made no LLM calls and created no duplicates
+    assert mock_classify.call_count == len(input_ids)
     results = test_session.exec(select(ClassificationResponse)).all()
     assert len(results) == len(sample_inputs)
+
+
+@pytest.mark.asyncio
+async def test_classify_inputs(test_session: Session, sample_inputs: list[ClassificationInput], mock_prompt_template: str) -> None:
+    test_session.add_all(sample_inputs)
+    test_session.commit()
+
+    mock_result = ClassificationResponse(
+        most_investable_insight="test",
+        reason_its_investable="reason",
+        score=5
+    )
+
+    with patch('llm_classifier.classifier.classify_input', return_value=mock_result):
+        input_ids: list[int] = [input.id for input in sample_inputs if input.id is not None]
+        # A missing id fails without affecting the rest of the batch
+        results = await classify_inputs(input_ids + [9999], mock_prompt_template, ClassificationResponse, test_session)
+
+    assert results == [True] * len(input_ids) + [False]
+    responses = test_session.exec(select(ClassificationResponse)).all()
+    assert len(responses) == len(sample_inputs)
+
+
+@pytest.mark.asyncio
+async def test_classify_inputs_reuses_prefetched_inputs(test_engine: Engine, test_session: Session, mock_prompt_template: str) -> None:
+    inputs = [
+        ClassificationInput(input_text=f"Test {i}", extra_field="extra", input_type_id=1)
+        for i in range(120)
+    ]
+    test_session.add_all(inputs)
+    test_session.commit()
+    input_ids: list[int] = [input.id for input in inputs if input.id is not None]
+
+    mock_result = ClassificationResponse(
+        most_investable_insight="test",
+        reason_its_investable="reason",
+        score=5
+    )
+    statements: list[str] = []
+
+    def record_statement(conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+        statements.append(statement)
+
+    event.listen(test_engine, "before_cursor_execute", record_statement)
+    try:
+        with patch('llm_classifier.classifier.classify_input', return_value=mock_result):
+            results = await classify_inputs(input_ids, mock_prompt_template, ClassificationResponse, test_session, commit_every=10)
+    finally:
+        event.remove(test_engine, "before_cursor_execute", record_statement)
+
+    assert all(results)
+    # Only the up-front queries for the inputs and their existing responses;
+    # nothing is lazy-loaded or refreshed after the batch commits
+    assert sum(statement.lstrip().startswith("SELECT") for statement in statements) == 2
+
+
+@pytest.mark.asyncio
+async def test_classify_inputs_reports_failed_commit(test_session: Session, sample_inputs: list[ClassificationInput], mock_prompt_template: str) -> None:
+    test_session.add_all(sample_inputs)
+    test_session.commit()
+
+    # A missing required field violates a NOT NULL constraint on commit
+    mock_result = ClassificationResponse(
+        most_investable_insight=None,
+        reason_its_investable="reason",
+        score=5
+    )
+
+    with patch('llm_classifier.classifier.classify_input', return_value=mock_result):
+        input_ids: list[int] = [input.id for input in sample_inputs if input.id is not None]
+        results = await classify_inputs(input_ids, mock_prompt_template, ClassificationResponse, test_session)
+
+    assert results == [False] * len(input_ids)
+    responses = test_session.exec(select(ClassificationResponse)).all()
+    assert len(responses) == 0
+
+
+@pytest.mark.asyncio
+async def test_classify_inputs_skips_classified_inputs(test_session: Session, sample_inputs: list[ClassificationInput], mock_prompt_template: str) -> None:
+    test_session.add_all(sample_inputs)
+    test_session.commit()
+
+    mock_result = ClassificationResponse(
+        most_investable_insight="test",
+        reason_its_investable="reason",
+        score=5
+    )
+    input_ids: list[int] = [input.id for input in sample_inputs if input.id is not None]
+
+    with patch('llm_classifier.classifier.classify_input', return_value=mock_result) as mock_classify:
+        await classify_inputs(input_ids[:1], mock_prompt_template, ClassificationResponse, test_session)
+        results = await classify_inputs(input_ids, mock_prompt_template, ClassificationResponse, test_session)
+
+    # The already-classified input is reported as done without another LLM call
+    assert results == [True] * len(input_ids)
+    assert mock_classify.call_count == len(input_ids)
+    responses = test_session.exec(select(ClassificationResponse)).all()
+    assert len(responses) == len(sample_inputs)
@@ -4,54 +4,72 @@
 from dotenv import load_dotenv
 import pytest
 import base64
-import io
 import asyncio
-from PIL import Image
 from pydantic import BaseModel
-from sqlmodel import Session, select
+from sqlmodel import Session, select, col
 from llm_classifier.classifier import classify_input, process_single_input
 from llm_classifier.database import ClassificationInput, ClassificationResponse
 
 load_dotenv(override=True)
 
-@pytest.fixture
+# A 1-pixel red test image: the PNG that Pillow writes for
+# Image.new('RGB', (1, 1), color='red'), stored as a literal so it isn't
+# re-encoded on every run
+_PNG_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010802000000907753"
+    "de0000000c49444154789c63f8cfc0000003010100c9fe92ef0000000049454e"
+    "44ae426082"
+)
+_DATA_URL = f"data:image/png;base64,{base64.b64encode(_PNG_BYTES).decode('utf-8')}"
+
+
+@pytest.fixture(scope="session")
 def sample_image_bytes() -> bytes:
-    """Create a simple 1-pixel test image as bytes."""
-    img = Image.new('RGB', (1, 1), color='red')
-    img_byte_arr = io.BytesIO()
-    img.save(img_byte_arr, format='PNG')
-    return img_byte_arr.getvalue()
+    """The 1-pixel test image as bytes."""
+    return _PNG_BYTES
+
+
+# Number of inputs classified concurrently by the gather tests
+N_CONCURRENT = 8
 
 
 @pytest.fixture
-def sample_input_with_image(test_session: Session, sample_image_bytes: bytes) -> ClassificationInput:
-    """Create a sample input with an image attached."""
-    input_with_image = ClassificationInput(
-        input_text="Google's revenue is up 10% this quarter.",
-        extra_field="Profitability increased by 5%",
-        bytes_field=sample_image_bytes
-    )
-    test_session.add(input_with_image)
+def sample_inputs_with_image(test_session: Session, sample_image_bytes: bytes) -> list[ClassificationInput]:
+    """Create sample inputs with an image attached."""
+    inputs_with_image = [
+        ClassificationInput(
+            input_text=f"Google's revenue is up {i + 10}% this quarter.",
+            extra_field="Profitability increased by 5%",
+            bytes_field=sample_image_bytes
+        )
+        for i in range(N_CONCURRENT)
+    ]
+    test_session.add_all(inputs_with_image)
     test_session.commit()
-    return input_with_image
+    return inputs_with_image
 
 
 @pytest.fixture
-def sample_input_without_media(test_session: Session) -> ClassificationInput:
-    """Create a sample input without media."""
-    input_without_media = ClassificationInput(
-        input_text="Apple's revenue is up 15% this quarter.",
-        extra_field="Profitability increased by 10%"
-    )
-    test_session.add(input_without_media)
+def sample_inputs_without_media(test_session: Session) -> list[ClassificationInput]:
+    """Create sample inputs without media."""
+    inputs_without_media = [
+        ClassificationInput(
+            input_text=f"Apple's revenue is up {i + 15}% this quarter.",
+            extra_field="Profitability increased by 10%"
+        )
+        for i in range(N_CONCURRENT)
+    ]
+    test_session.add_all(inputs_without_media)
     test_session.commit()
-    return input_without_media
+    return inputs_without_media
 
 
 @pytest.mark.live
-@pytest.mark.asyncio
-async def test_classify_input_without_media() -> None:
-    """Test the classify_input function without media data."""
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.parametrize("n_concurrent", [1, N_CONCURRENT])
+async def test_classify_input_without_media(n_concurrent: int) -> None:
+    """Test the classify_input function without media data, sending
+    `n_concurrent` requests at once."""
     # Test prompt that mentions the image
     test_prompt = (
         "Classify the sentiment of this emoji on a scale from 1 (negative) to 5 (positive): :)\n"
@@ -61,52 +79,50 @@ async def test_classify_input_without_media() -> None:
         reason: str
         sentiment: int
 
-    # Call classify_input with the media data
-    result = await classify_input(test_prompt, ResponseModel, None)
+    # Number the prompts, so identical requests aren't served from the cache
+    results = await asyncio.gather(*[
+        classify_input(f"{test_prompt}\nRequest {i}.", ResponseModel, None)
+        for i in range(n_concurrent)
+    ])
 
-    # Verify we got a valid response
-    assert result is not None
-    assert isinstance(result, ResponseModel)
-    assert result.reason
-    assert result.sentiment
+    # Verify we got valid responses
+    for result in results:
+        assert result is not None
+        assert isinstance(result, ResponseModel)
+        assert result.reason
+        assert result.sentiment
 
 
 @pytest.mark.live
-@pytest.mark.asyncio
-async def test_gather_classified_inputs_without_media(test_session: Session, sample_input_without_media: ClassificationInput, mock_prompt_template: str) -> None:
-    """Test that process_single_input function works with `asyncio.gather` an input without media."""
-    # Get the ID of the sample input
-    input_id = sample_input_without_media.id
-    assert input_id is not None
+@pytest.mark.asyncio(loop_scope="session")
+async def test_gather_classified_inputs_without_media(test_session: Session, sample_inputs_without_media: list[ClassificationInput], mock_prompt_template: str) -> None:
+    """Test that process_single_input function works with `asyncio.gather` over several inputs without media."""
+    # Get the IDs of the sample inputs
+    input_ids = [input.id for input in sample_inputs_without_media if input.id is not None]
+    assert len(input_ids) == N_CONCURRENT
 
-    await asyncio.gather(*[process_single_input(id, mock_prompt_template, ClassificationResponse, test_session) for id in [input_id]])
+    await asyncio.gather(*[process_single_input(id, mock_prompt_template, ClassificationResponse, test_session) for id in input_ids])
 
-    # Verify the result
-    result = test_session.exec(
+    # Verify the results
+    results = test_session.exec(
         select(ClassificationResponse)
-        .where(ClassificationResponse.input_id == input_id)
-    ).first()
+        .where(col(ClassificationResponse.input_id).in_(input_ids))
+    ).all()
 
-    assert result is not None
-    assert isinstance(result, ClassificationResponse)
-    assert result.most_investable_insight
-    assert result.reason_its_investable
-    assert isinstance(result.score, int)
+    assert len(results) == N_CONCURRENT
+    for result in results:
+        assert isinstance(result, ClassificationResponse)
+        assert result.most_investable_insight
+        assert result.reason_its_investable
+        assert isinstance(result.score, int)
 
 
 @pytest.mark.live
-@pytest.mark.asyncio
-async def test_classify_input_with_media() -> None:
-    """Test the classify_input function with media data."""
-    # Create a simple test image
-    img = Image.new('RGB', (1, 1), color='red')
-    img_byte_arr = io.BytesIO()
-    img.save(img_byte_arr, format='PNG')
-    img_bytes = img_byte_arr.getvalue()
-
-    # Encode the image as base64 with data URL format
-    encoded_image = f"data:image/png;base64,{base64.b64encode(img_bytes).decode('utf-8')}"
-
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.parametrize("n_concurrent", [1, N_CONCURRENT])
+async def test_classify_input_with_media(n_concurrent: int) -> None:
+    """Test the classify_input function with media data, sending
+    `n_concurrent` requests at once."""
     # Test prompt that mentions the image
     test_prompt = (
         "Classify the sentiment of this image on a scale from 1 "
@@ -119,34 +135,39 @@ async def test_classify_input_with_media() -> None:
         reason: str
         sentiment: int
 
-    # Call classify_input with the media data
-    result = await classify_input(test_prompt, ResponseModel, [encoded_image])
+    # Number the prompts, so identical requests aren't served from the cache
+    results = await asyncio.gather(*[
+        classify_input(f"{test_prompt}\nRequest {i}.", ResponseModel, [_DATA_URL])
+        for i in range(n_concurrent)
+    ])
 
-    # Verify we got a valid response
-    assert result is not None
-    assert isinstance(result, ResponseModel)
-    assert result.reason
-    assert result.sentiment
+    # Verify we got valid responses
+    for result in results:
+        assert result is not None
+        assert isinstance(result, ResponseModel)
+        assert result.reason
+        assert result.sentiment
 
 
 @pytest.mark.live
-@pytest.mark.asyncio
-async def test_gather_classified_inputs_with_media(test_session: Session, sample_input_with_image: ClassificationInput, mock_prompt_template: str) -> None:
-    """Test that process_single_input function works with `asyncio.gather` an input with media."""
-    # Get the ID of the sample input
-    input_id = sample_input_with_image.id
-    assert input_id is not None
+@pytest.mark.asyncio(loop_scope="session")
+async def test_gather_classified_inputs_with_media(test_session: Session, sample_inputs_with_image: list[ClassificationInput], mock_prompt_template: str) -> None:
+    """Test that process_single_input function works with `asyncio.gather` over several inputs with media."""
+    # Get the IDs of the sample inputs
+    input_ids = [input.id for input in sample_inputs_with_image if input.id is not None]
+    assert len(input_ids) == N_CONCURRENT
 
-    await asyncio.gather(*[process_single_input(id, mock_prompt_template, ClassificationResponse, test_session) for id in [input_id]])
+    await asyncio.gather(*[process_single_input(id, mock_prompt_template, ClassificationResponse, test_session) for id in input_ids])
 
-    # Verify the result
-    result = test_session.exec(
+    # Verify the results
+    results = test_session.exec(
         select(ClassificationResponse)
-        .where(ClassificationResponse.input_id == input_id)
-    ).first()
-
-    assert result is not None
-    assert isinstance(result, ClassificationResponse)
-    assert result.most_investable_insight
-    assert result.reason_its_investable
-    assert isinstance(result.score, int)
\ No newline at end of file
+        .where(col(ClassificationResponse.input_id).in_(input_ids))
+    ).all()
+
+    assert len(results) == N_CONCURRENT
+    for result in results:
+        assert isinstance(result, ClassificationResponse)
+        assert result.most_investable_insight
+        assert result.reason_its_investable
+        assert isinstance(result.score, int)
@@ -1,9 +1,11 @@
 # test_downloader.py
 
+import threading
+from sqlalchemy import Engine, event
 from llm_classifier.downloader import download_data, Downloader
 from llm_classifier.database import ClassificationInput, InputType
-from sqlmodel import Session, select
-from typing import Any
+from sqlmodel import Session, select, col
+from typing import Any, Iterator
     
 def test_bulk_downloader(test_session: Session) -> None:
     """Test a downloader that implements bulk fetching via get_records"""
@@ -25,7 +27,7 @@ def test_bulk_downloader(test_session: Session) -> None:
 
     # Test with valid input type
     input_types = test_session.exec(select(InputType).where(InputType.name == "8-K")).all()
-    result_ids = download_data(test_session, input_types, BulkDownloader)
+    result_ids = list(download_data(test_session, input_types, BulkDownloader))
 
     # Verify records were created
     assert len(result_ids) == 2
@@ -34,6 +36,53 @@ def test_bulk_downloader(test_session: Session) -> None:
     assert all(r.input_type and r.input_type.id == 1 for r in records)
     assert {r.input_text for r in records} == {"Bulk 8-K 1", "Bulk 8-K 2"} # type: ignore
 
+def test_bulk_downloader_many_records(test_session: Session) -> None:
+    """Test that a download spanning several batches saves every record in order"""
+    class LargeBulkDownloader(Downloader):
+        @classmethod
+        def get_records(cls, input_type: InputType) -> list[ClassificationInput]:
+            return [
+                ClassificationInput(
+                    input_text=f"Bulk {i}",
+                    extra_field="test",
+                    input_type_id=input_type.id
+                )
+                for i in range(250)
+            ]
+
+    input_types = test_session.exec(select(InputType).where(InputType.name == "8-K")).all()
+    result_ids = list(download_data(test_session, input_types, LargeBulkDownloader))
+
+    assert len(result_ids) == 250
+    records = test_session.exec(
+        select(ClassificationInput).order_by(col(ClassificationInput.id))
+    ).all()
+    assert [r.id for r in records] == result_ids
+    assert [r.input_text for r in records] == [f"Bulk {i}" for i in range(250)] # type: ignore
+
+def test_bulk_downloader_generator(test_session: Session) -> None:
+    """Test that bulk records from a generator are built one batch at a time"""
+    built = 0
+
+    class StreamingDownloader(Downloader):
+        @classmethod
+        def get_records(cls, input_type: InputType) -> Iterator[ClassificationInput]:
+            nonlocal built
+            for i in range(5):
+                built += 1
+                yield ClassificationInput(
+                    input_text=f"Streamed {i}",
+                    extra_field="test",
+                    input_type_id=input_type.id
+                )
+
+    input_types = test_session.exec(select(InputType).where(InputType.name == "8-K")).all()
+    result_ids = download_data(test_session, input_types, StreamingDownloader, commit_interval=2)
+
+    next(result_ids)
+    assert built == 2
+    assert len(list(result_ids)) == 4
+
 def test_list_downloader(test_session: Session) -> None:
     """Test a downloader that uses per-record fetching"""
     class ListDownloader(Downloader):
@@ -50,7 +99,7 @@ def test_list_downloader(test_session: Session) -> None:
             )
 
     input_types = test_session.exec(select(InputType).where(InputType.name == "8-K")).all()
-    result_ids = download_data(test_session, input_types, ListDownloader)
+    result_ids = list(download_data(test_session, input_types, ListDownloader))
     
     assert len(result_ids) == 3
     records = test_session.exec(select(ClassificationInput)).all()
@@ -58,6 +107,120 @@ def test_list_downloader(test_session: Session) -> None:
     assert all(r.input_type.name == "8-K" for r in records)
     assert {r.input_text for r in records} == {"Item 1", "Item 2", "Item 3"} # type: ignore
 
+def test_list_downloader_fetches_in_calling_thread_by_default(test_session: Session) -> None:
+    """Test that per-record fetches only use worker threads on request"""
+    fetch_threads: set[threading.Thread] = set()
+
+    class ListDownloader(Downloader):
+        @classmethod
+        def get_record_ids(cls, input_type: InputType) -> list[Any]:
+            return [1, 2]
+
+        @classmethod
+        def get_record(cls, record_id: Any, input_type: InputType) -> ClassificationInput | None:
+            fetch_threads.add(threading.current_thread())
+            return ClassificationInput(
+                input_text=f"Item {record_id}",
+                extra_field="test",
+                input_type=input_type
+            )
+
+    input_types = test_session.exec(select(InputType).where(InputType.name == "8-K")).all()
+    result_ids = list(download_data(test_session, input_types, ListDownloader))
+
+    assert len(result_ids) == 2
+    assert fetch_threads == {threading.current_thread()}
+
+def test_list_downloader_fetches_concurrently(test_session: Session) -> None:
+    """Test that per-record fetches run in parallel worker threads"""
+    # Each fetch waits for a second one to start, so a serial download fails
+    barrier = threading.Barrier(2, timeout=5)
+
+    class ConcurrentDownloader(Downloader):
+        @classmethod
+        def get_record_ids(cls, input_type: InputType) -> list[Any]:
+            return [1, 2]
+
+        @classmethod
+        def get_record(cls, record_id: Any, input_type: InputType) -> ClassificationInput | None:
+            barrier.wait()
+            return ClassificationInput(
+                input_text=f"Item {record_id}",
+                extra_field="test",
+                input_type_id=input_type.id
+            )
+
+    input_types = test_session.exec(select(InputType).where(InputType.name == "8-K")).all()
+    result_ids = list(download_data(test_session, input_types, ConcurrentDownloader, max_workers=2))
+
+    assert len(result_ids) == 2
+
+
+def test_list_downloader_keeps_session_in_calling_thread(test_engine: Engine, test_session: Session) -> None:
+    """Test that worker threads never query through the session, even after a
+    commit expires the input type"""
+    saved = threading.Event()
+    query_threads: set[threading.Thread] = set()
+
+    class ListDownloader(Downloader):
+        @classmethod
+        def get_record_ids(cls, input_type: InputType) -> list[Any]:
+            return [1, 2, 3]
+
+        @classmethod
+        def get_record(cls, record_id: Any, input_type: InputType) -> ClassificationInput | None:
+            if record_id > 1:
+                saved.wait(timeout=5)
+            return ClassificationInput(
+                input_text=f"{input_type.name} {record_id}",
+                extra_field="test",
+                input_type=input_type
+            )
+
+    def record_thread(*args: Any) -> None:
+        query_threads.add(threading.current_thread())
+
+    input_types = test_session.exec(select(InputType).where(InputType.name == "8-K")).all()
+    event.listen(test_session, "after_commit", lambda session: saved.set())
+    event.listen(test_engine, "before_cursor_execute", record_thread)
+    try:
+        result_ids = list(download_data(test_session, input_types, ListDownloader, commit_interval=1, max_workers=2))
+    finally:
+        event.remove(test_engine, "before_cursor_execute", record_thread)
+
+    assert len(result_ids) == 3
+    assert query_threads == {threading.current_thread()}
+    records = test_session.exec(select(ClassificationInput)).all()
+    assert all(r.input_type_id == 1 for r in records)
+    assert {r.input_text for r in records} == {"8-K 1", "8-K 2", "8-K 3"} # type: ignore
+
+def test_list_downloader_bounds_pending_fetches(test_session: Session) -> None:
+    """Test that only a bounded number of fetches are submitted ahead of the
+    consumer, so stopping early does not wait for every record"""
+    fetched: list[Any] = []
+
+    class ListDownloader(Downloader):
+        @classmethod
+        def get_record_ids(cls, input_type: InputType) -> list[Any]:
+            return list(range(1000))
+
+        @classmethod
+        def get_record(cls, record_id: Any, input_type: InputType) -> ClassificationInput | None:
+            fetched.append(record_id)
+            return ClassificationInput(
+                input_text=f"Item {record_id}",
+                extra_field="test",
+                input_type_id=input_type.id
+            )
+
+    input_types = test_session.exec(select(InputType).where(InputType.name == "8-K")).all()
+    ids = download_data(test_session, input_types, ListDownloader, commit_interval=1, max_workers=2)
+    next(ids)
+    ids.close()
+
+    assert len(fetched) <= 5
+
+
 def test_mixed_failure_handling(test_session: Session) -> None:
     """Test error handling when some records fail to download"""
     class FaultyDownloader(Downloader):
@@ -76,10 +239,32 @@ def test_mixed_failure_handling(test_session: Session) -> None:
             )
 
     input_types = test_session.exec(select(InputType).where(InputType.name == "8-K")).all()
-    result_ids = download_data(test_session, input_types, FaultyDownloader)
+    result_ids = list(download_data(test_session, input_types, FaultyDownloader))
     
     # Should process 2 successful records
     assert len(result_ids) == 2
     records = test_session.exec(select(ClassificationInput)).all()
     assert len(records) == 2
-    assert {r.input_text for r in records} == {"OK 1", "OK 3"} # type: ignore
\ No newline at end of file
+    assert {r.input_text for r in records} == {"OK 1", "OK 3"} # type: ignore
+
+def test_batch_failure_handling(test_session: Session) -> None:
+    """Test that a record failing to persist does not discard the rest of its batch"""
+    class PoisonDownloader(Downloader):
+        @classmethod
+        def get_records(cls, input_type: InputType) -> list[ClassificationInput]:
+            return [
+                ClassificationInput(
+                    # Violates the NOT NULL constraint on input_text
+                    input_text=None if i == 2 else f"Row {i}",
+                    extra_field="test",
+                    input_type=input_type
+                )
+                for i in range(5)
+            ]
+
+    input_types = test_session.exec(select(InputType).where(InputType.name == "8-K")).all()
+    result_ids = list(download_data(test_session, input_types, PoisonDownloader, commit_interval=3))
+
+    assert len(result_ids) == 4
+    records = test_session.exec(select(ClassificationInput)).all()
+    assert {r.input_text for r in records} == {"Row 0", "Row 1", "Row 3", "Row 4"} # type: ignore
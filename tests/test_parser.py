@@ -1,6 +1,9 @@
 # test_parser.py
 
+import pytest
+from enum import Enum
 from typing import Optional
+from pydantic import ValidationError
 from sqlmodel import SQLModel, Field
 from llm_classifier.parser import get_model_from_json, get_gemini_schema
 
@@ -14,6 +17,18 @@ class SampleResponse(SQLModel):
     optional_int: Optional[int] = None
 
 
+class Sentiment(str, Enum):
+    POSITIVE = "positive"
+    NEGATIVE = "negative"
+
+
+class SampleTableResponse(SQLModel, table=True):
+    __tablename__ = "sample_table_response"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    sentiment: Sentiment
+    score: int
+
+
 def test_get_model_from_json() -> None:
     # Test with different field types
     json_str = '''
@@ -46,6 +61,27 @@ def test_get_model_from_json() -> None:
     assert result.optional_int is None
 
 
+def test_get_model_from_fenced_json() -> None:
+    content = '```json\n{"string_field": "test", "int_field": 42}\n```'
+    result = get_model_from_json(content, SampleResponse)
+    assert result.string_field == "test"
+    assert result.int_field == 42
+
+
+def test_get_model_from_json_validates_table_models() -> None:
+    result = get_model_from_json('{"sentiment": "positive", "score": "4"}', SampleTableResponse)
+    assert result.sentiment == Sentiment.POSITIVE
+    assert result.score == 4
+
+    for content in (
+        '{"sentiment": "very positive", "score": 4}',
+        '{"sentiment": "positive", "score": "four"}',
+        '{"sentiment": "positive"}',
+    ):
+        with pytest.raises(ValidationError):
+            get_model_from_json(content, SampleTableResponse)
+
+
 def test_get_gemini_schema() -> None:
     schema = get_gemini_schema(SampleResponse)
 
@@ -71,4 +107,4 @@ def test_get_gemini_schema() -> None:
     assert "string_field" in schema["required"]
     assert "int_field" in schema["required"]
     assert "optional_string" not in schema["required"]
-    assert "optional_int" not in schema["required"]
\ No newline at end of file
+    assert "optional_int" not in schema["required"]
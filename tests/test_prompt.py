@@ -1,56 +1,73 @@
 # test_prompt.py
 
+from pathlib import Path
+from typing import Any
 from sqlmodel import Session, select
-from sqlalchemy.engine import Engine
+from sqlalchemy import text
 
-from llm_classifier.database import ClassificationInput, ClassificationResponse
+from llm_classifier.database import ClassificationInput, ClassificationResponse, InputType, init_database, seed_input_types
 from llm_classifier.validators import get_placeholders
 
+# A test value for each response field, keyed on the field's annotation
+_DEFAULTS: dict[Any, Any] = {str: "Test value", int: 5}
+_RESPONSE_TEMPLATE = {
+    field: _DEFAULTS.get(field_info.annotation)
+    for field, field_info in ClassificationResponse.model_fields.items()
+    if field not in ('id', 'input_id', 'classification_input')
+}
+
 
 def test_that_prompt_template_has_valid_placeholders(mock_prompt_template: str) -> None:
     placeholders = get_placeholders(mock_prompt_template, ClassificationInput)
     assert len(placeholders) > 0
 
 
-def test_classification_models(test_engine: Engine) -> None:
-    with Session(test_engine) as session:
-        # Create a ClassificationInput
-        input_1 = ClassificationInput(
-            input_text="Test filing text",
-            ticker="TEST",
-            extra_field="extra_value"
-        )
-        session.add(input_1)
-        session.commit()
-
-        # Create a ClassificationResponse with dynamic fields
-        response_data = {
-            field: "Test value" if isinstance(field_info.annotation, type(str))
-                   else 5 if isinstance(field_info.annotation, type(int))
-                   else None
-            for field, field_info in ClassificationResponse.model_fields.items()
-            if field not in ('id', 'input_id', 'classification_input')
-        }
-        response_1 = ClassificationResponse(
-            **response_data,
-            input_id=input_1.id
-        )
-        session.add(response_1)
-        session.commit()
-
-        # Verify that the response is associated with the input
-        statement_1 = select(ClassificationInput).where(ClassificationInput.id == input_1.id)
-        retrieved_input = session.exec(statement_1).one()
-        classification_response = retrieved_input.classification_response
-        assert classification_response is not None
-        
-        # Verify all fields dynamically
-        for field, value in response_data.items():
-            assert getattr(classification_response, field) == value
-
-        # Verify that deleting the input cascades to the response
-        session.delete(input_1)
-        session.commit()
-        statement_2 = select(ClassificationResponse).where(ClassificationResponse.id == response_1.id)
-        retrieved_response = session.exec(statement_2).one_or_none()
-        assert retrieved_response is None
\ No newline at end of file
+def test_database_uses_wal_journal(tmp_path: Path) -> None:
+    # Needs a database file, since in-memory databases have no WAL
+    engine = init_database(str(tmp_path / "test.db"))
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+    engine.dispose()
+
+
+def test_seed_input_types_skips_existing(test_session: Session) -> None:
+    seed_input_types(test_session, input_types=["10-K", "10-Q", "10-Q"])
+    names = test_session.exec(select(InputType.name)).all()
+    assert sorted(names) == ["10-K", "10-Q", "8-K"]
+
+
+def test_classification_models(test_session: Session) -> None:
+    # Create a ClassificationInput
+    input_1 = ClassificationInput(
+        input_text="Test filing text",
+        ticker="TEST",
+        extra_field="extra_value"
+    )
+    test_session.add(input_1)
+    test_session.commit()
+
+    # Create a ClassificationResponse with dynamic fields
+    response_data = dict(_RESPONSE_TEMPLATE)
+    response_1 = ClassificationResponse(
+        **response_data,
+        input_id=input_1.id
+    )
+    test_session.add(response_1)
+    test_session.commit()
+
+    # Verify that the response is associated with the input
+    statement_1 = select(ClassificationInput).where(ClassificationInput.id == input_1.id)
+    retrieved_input = test_session.exec(statement_1).one()
+    classification_response = retrieved_input.classification_response
+    assert classification_response is not None
+
+    # Verify all fields dynamically
+    for field, value in response_data.items():
+        assert getattr(classification_response, field) == value
+
+    # Verify that deleting the input cascades to the response
+    test_session.delete(input_1)
+    test_session.commit()
+    statement_2 = select(ClassificationResponse).where(ClassificationResponse.id == response_1.id)
+    retrieved_response = test_session.exec(statement_2).one_or_none()
+    assert retrieved_response is None
@@ -1,15 +1,17 @@
 # test_summarizer.py
 
+from datetime import date, timedelta
 from pathlib import Path
 from pytest import CaptureFixture
-from sqlmodel import Session
+from sqlmodel import Session, SQLModel, create_engine
 from llm_classifier.summarizer import (
     format_stats_summary,
     print_summary_statistics,
     export_responses,
     get_exportable_fields,
+    get_numeric_sequence,
 )
-from llm_classifier.database import ClassificationResponse
+from llm_classifier.database import ClassificationInput, ClassificationResponse
 
 def test_format_stats_summary() -> None:
     """Test statistics formatting with various inputs."""
@@ -38,6 +40,13 @@ def test_print_summary_statistics(test_session_with_sample_data: Session, capsys
     assert "Total Inputs Processed: 4" in captured.out
 
 
+def test_get_numeric_sequence_since_date(test_session_with_sample_data: Session) -> None:
+    """Test that an explicit date replaces the current date as the cutoff."""
+    assert len(get_numeric_sequence(test_session_with_sample_data, "score")) == 4
+    tomorrow = date.today() + timedelta(days=1)
+    assert not get_numeric_sequence(test_session_with_sample_data, "score", today=tomorrow)
+
+
 def test_get_exportable_fields() -> None:
     """Test getting exportable fields from a model."""
     fields = get_exportable_fields(ClassificationResponse)
@@ -78,6 +87,22 @@ def test_export_responses(test_session_with_sample_data: Session, tmp_path: Path
         assert int(data[score_idx]) >= 7
 
 
+def test_export_responses_input_type_name(test_session_with_sample_data: Session, tmp_path: Path) -> None:
+    """Test that the input_type field exports the input type's name."""
+    output_file = tmp_path / "test_output.csv"
+    export_responses(
+        test_session_with_sample_data,
+        str(output_file),
+        where_clauses=[ClassificationResponse.score >= 7], # type: ignore
+        input_fields=["id", "input_type"]
+    )
+
+    with open(output_file) as f:
+        lines = f.read().splitlines()
+        assert lines[0].startswith("id,input_type,")
+        assert {line.split(',')[1] for line in lines[1:]} == {"8-K"}
+
+
 def test_export_responses_no_results(test_session_with_sample_data: Session, tmp_path: Path) -> None:
     """Test exporting when no results meet the criteria."""
     output_file = tmp_path / "test_output.csv"
@@ -89,3 +114,39 @@ def test_export_responses_no_results(test_session_with_sample_data: Session, tmp
     )
 
     assert not output_file.exists()
+
+
+def test_print_summary_statistics_in_sql(test_session_with_sample_data: Session, capsys: CaptureFixture) -> None:
+    """Test that the SQL summary matches the in-Python summary."""
+    print_summary_statistics(test_session_with_sample_data, numeric_field="score")
+    full_output = capsys.readouterr().out
+
+    print_summary_statistics(test_session_with_sample_data, numeric_field="score", breakpoints=0)
+    sql_output = capsys.readouterr().out
+
+    numeric_sequence = get_numeric_sequence(test_session_with_sample_data, "score")
+    assert sql_output.strip() == format_stats_summary(numeric_sequence).strip()
+    assert "Distribution:" not in sql_output
+    assert full_output.startswith(sql_output)
+    assert "Distribution:" in full_output
+
+
+def test_print_summary_statistics_in_sql_on_plain_engine(capsys: CaptureFixture) -> None:
+    """Test that the SQL summary does not rely on functions registered by
+    init_database."""
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        inputs = [ClassificationInput(input_text=f"Test {i}", extra_field="extra") for i in range(3)]
+        session.add_all(inputs)
+        session.flush()
+        session.add_all(
+            ClassificationResponse(most_investable_insight="a", score=score, reason_its_investable="b", input_id=input.id)
+            for score, input in zip([2, 4, 9], inputs)
+        )
+        session.commit()
+
+        print_summary_statistics(session, numeric_field="score", breakpoints=0)
+    engine.dispose()
+
+    assert capsys.readouterr().out.strip() == format_stats_summary([2, 4, 9]).strip()
@@ -1,12 +1,14 @@
 # test_validators.py
 
+import json
 import pytest
 from sqlmodel import SQLModel, Field
 from datetime import datetime, UTC
 from llm_classifier.validators import (
     get_json,
     TemplateError,
-    get_placeholders
+    get_placeholders,
+    get_template_prefix
 )
 from typing import Optional
 
@@ -68,6 +70,13 @@ def test_get_json_with_quotes() -> None:
     assert result == {"key": "value"}
 
 
+def test_get_json_invalid() -> None:
+    """Test that invalid JSON raises the stdlib JSONDecodeError."""
+    with pytest.raises(json.JSONDecodeError) as excinfo:
+        get_json('{"key": "value",\n "other": }')
+    assert excinfo.value.lineno == 2
+
+
 def test_get_placeholders_with_valid_constants(valid_model: type[SQLModel]) -> None:
     """Test getting placeholders from prompt template."""    
     valid_prompt = """
@@ -138,3 +147,14 @@ def test_get_placeholders_requires_non_bytes_fields(model_with_bytes_field: type
         get_placeholders(template, model_with_bytes_field)
     
     assert "name" in str(exc_info.value)
+
+
+def test_get_template_prefix() -> None:
+    """Test extracting the static text before the first placeholder"""
+    template = "Return {{\"key\": 1}} for:\n{field1}\nand {field2}"
+    prefix = get_template_prefix(template)
+
+    assert prefix == 'Return {"key": 1} for:\n'
+    assert template.format(field1="a", field2="b").startswith(prefix)
+    assert get_template_prefix("{field1} first") == ""
+    assert get_template_prefix("No placeholders") == "No placeholders"